@@ -13,75 +13,274 @@ Outputs for GitHub Actions (when --github-output is passed):
 """
 
 import argparse
+import functools
+import itertools
 import json
+import os
+import re
+import stat
 import sys
 from pathlib import Path
-from typing import Dict, List, Optional, Set
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-import yaml
+try:
+    import orjson
+except ImportError:  # optional; fall back to the stdlib encoder
+    orjson = None
 
+# Changed-file matchers: versions/*.version, and a board directory or anything
+# inside it (capturing "<vendor>/<name>"). A bare board path shows up for
+# submodule or symlinked board directories. Both are anchored on their rare
+# directory prefix, the most selective test, so nearly every changed path is
+# rejected on its first few characters before the suffix is looked at.
+_VERSION_RE = re.compile(r"^versions/[^/]+\.version$").match
+_BOARD_RE = re.compile(r"^boards/([^/]+/[^/]+)(?:/|$)").match
 
-def read_board_spec(spec_path: Path) -> Optional[Dict]:
-    """Load a board spec.yaml file."""
+# On-disk board index, relative to the base path, reused across runs.
+_INDEX_CACHE = Path(".cache") / "board_index.json"
+
+# Parsed specs keyed by (path, mtime_ns, size) so unchanged files are reused.
+_SPEC_CACHE: Dict[Tuple[str, int, int], Optional[Dict]] = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _yaml_loader():
+    """Import PyYAML on first use and pick the fastest safe loader.
+
+    Runs that never parse a spec (no affected boards, or every spec served
+    from the on-disk index) skip the PyYAML import entirely.
+    """
+    import yaml  # pylint: disable=import-outside-toplevel
+
+    try:
+        from yaml import CSafeLoader as loader
+    except ImportError:  # libyaml bindings not available
+        from yaml import SafeLoader as loader
+    return yaml, loader
+
+
+def _read_spec(spec_path: str) -> Tuple[Tuple[str, int, int], Optional[bytes]]:
+    """Return the memo key for a spec file and its raw bytes.
+
+    The bytes are None when ``_SPEC_CACHE`` already holds the parsed spec for
+    that key, so unchanged files are not read again.
+    """
+    # Specs are small, so fstat the descriptor once and read the whole file
+    # in a single syscall rather than through buffered text I/O.
+    fd = os.open(spec_path, os.O_RDONLY)
+    try:
+        st = os.fstat(fd)
+        key = (spec_path, st.st_mtime_ns, st.st_size)
+        if key in _SPEC_CACHE:
+            return key, None
+        return key, os.read(fd, st.st_size)
+    finally:
+        os.close(fd)
+
+
+def read_board_spec(spec_path: str) -> Optional[Dict]:
+    """Load a board spec.yaml file, reusing the cached result if unchanged."""
+    yaml, loader = _yaml_loader()
     try:
-        with open(spec_path, "r", encoding="utf-8") as handle:
-            return yaml.safe_load(handle)
+        key, data = _read_spec(spec_path)
+        if data is None:
+            return _SPEC_CACHE[key]
+        spec = yaml.load(data, Loader=loader)
+        _SPEC_CACHE[key] = spec
+        return spec
     except Exception as exc:  # pylint: disable=broad-except
         print(f"Warning: failed to read {spec_path}: {exc}", file=sys.stderr)
         return None
 
 
+def _load_index_cache(base_path: Path) -> Dict[str, Dict]:
+    """Load the on-disk board index left by a previous run, if any."""
+    try:
+        with open(base_path / _INDEX_CACHE, "r", encoding="utf-8") as handle:
+            cached = json.load(handle)
+    except FileNotFoundError:
+        return {}
+    except Exception as exc:  # pylint: disable=broad-except
+        print(f"Warning: ignoring board index cache: {exc}", file=sys.stderr)
+        return {}
+    return cached if isinstance(cached, dict) else {}
+
+
+def _save_index_cache(base_path: Path, index: Dict[str, Dict]) -> None:
+    """Atomically replace the on-disk board index."""
+    cache_file = base_path / _INDEX_CACHE
+    tmp_file = cache_file.with_suffix(".tmp")
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_file, "w", encoding="utf-8") as handle:
+            json.dump(index, handle, separators=(",", ":"), sort_keys=True)
+        os.replace(tmp_file, cache_file)
+    except OSError as exc:
+        print(f"Warning: failed to write {cache_file}: {exc}", file=sys.stderr)
+
+
+def _spec_arch(spec: Optional[Dict]) -> str:
+    """Pull board.cpu.arch out of a parsed spec."""
+    if isinstance(spec, dict):
+        return spec.get("board", {}).get("cpu", {}).get("arch", "unknown")
+    return "unknown"
+
+
+def _load_specs_batched(spec_paths: List[str]) -> Optional[List]:
+    """Parse several spec files as one multi-document YAML stream.
+
+    Files already memoised in ``_SPEC_CACHE`` are not re-read; the rest are
+    parsed together and memoised. Returns None when any file fails to read
+    or parse, or when the stream does not split back into exactly one
+    document per file (e.g. a spec with its own ``---`` markers); callers
+    then load the files one by one.
+    """
+    yaml, loader = _yaml_loader()
+    try:
+        reads = [_read_spec(spec_path) for spec_path in spec_paths]
+        pending = [(key, data) for key, data in reads if data is not None]
+        if pending:
+            stream = b"".join(b"---\n" + data + b"\n" for _, data in pending)
+            docs = list(yaml.load_all(stream, Loader=loader))
+            if len(docs) != len(pending):
+                return None
+            for (key, _), doc in zip(pending, docs):
+                _SPEC_CACHE[key] = doc
+    except Exception:  # pylint: disable=broad-except
+        return None
+    return [_SPEC_CACHE[key] for key, _ in reads]
+
+
 def find_all_boards(base_path: Path) -> List[Dict[str, str]]:
     """Return every board with its architecture."""
     boards: List[Dict[str, str]] = []
     boards_dir = base_path / "boards"
 
-    if not boards_dir.exists():
+    if not boards_dir.is_dir():
         return boards
 
-    for spec_file in boards_dir.rglob("spec.yaml"):
-        relative = spec_file.parent.relative_to(boards_dir)
-        board_path = str(relative)
+    # Boards always live at boards/<vendor>/<name>/spec.yaml, so walk exactly
+    # two levels instead of recursing through every file under boards/.
+    spec_files: List[Tuple[str, str, int, int]] = []
+    with os.scandir(boards_dir) as vendors:
+        for vendor in vendors:
+            if not vendor.is_dir():
+                continue
+            with os.scandir(vendor.path) as names:
+                for name in names:
+                    if not name.is_dir():
+                        continue
+                    spec_file = os.path.join(name.path, "spec.yaml")
+                    try:
+                        st = os.stat(spec_file)
+                    except OSError:
+                        continue
+                    if stat.S_ISREG(st.st_mode):
+                        board_path = f"{vendor.name}/{name.name}"
+                        spec_files.append(
+                            (board_path, spec_file, st.st_mtime_ns, st.st_size)
+                        )
 
-        spec = read_board_spec(spec_file) or {}
-        arch = "unknown"
-        if isinstance(spec, dict):
-            arch = spec.get("board", {}).get("cpu", {}).get("arch", "unknown")
+    if not spec_files:
+        return boards
 
-        boards.append({"board": board_path, "arch": arch})
+    # Reuse architectures from the on-disk index for specs that have not
+    # changed since it was written; only the rest need a YAML parse.
+    cached = _load_index_cache(base_path)
+    index: Dict[str, Dict] = {}
+    arches: Dict[str, str] = {}
+    misses: List[Tuple[str, str, int, int]] = []
+    for board_path, spec_file, mtime_ns, size in spec_files:
+        entry = cached.get(board_path)
+        if (
+            isinstance(entry, dict)
+            and entry.get("mtime_ns") == mtime_ns
+            and entry.get("size") == size
+        ):
+            index[board_path] = entry
+            arches[board_path] = entry.get("arch", "unknown")
+        else:
+            misses.append((board_path, spec_file, mtime_ns, size))
 
-    return boards
+    if misses:
+        # A single loader over all misses amortises parser setup; if the
+        # batch cannot be split cleanly, parse the files concurrently.
+        miss_paths = [m[1] for m in misses]
+        specs = _load_specs_batched(miss_paths)
+        if specs is None:
+            # Imported here: concurrent.futures pulls in logging, which is
+            # noticeable startup cost on runs that never need the pool.
+            from concurrent.futures import ThreadPoolExecutor
 
+            workers = min(32, (os.cpu_count() or 1) * 4, len(misses))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                specs = list(executor.map(read_board_spec, miss_paths))
+
+        for (board_path, _, mtime_ns, size), spec in zip(misses, specs):
+            arches[board_path] = _spec_arch(spec)
+            # Unreadable specs stay out of the index so they are retried.
+            if spec is not None:
+                index[board_path] = {
+                    "arch": arches[board_path],
+                    "mtime_ns": mtime_ns,
+                    "size": size,
+                }
+
+    if index != cached:
+        _save_index_cache(base_path, index)
+
+    for board_path in sorted(arches):
+        boards.append({"board": board_path, "arch": arches[board_path]})
 
-def extract_affected_boards(changed_files: List[str]) -> Set[str]:
-    """Collect board identifiers that have file changes."""
-    boards: Set[str] = set()
-    for changed in changed_files:
-        path = Path(changed)
-        if len(path.parts) >= 3 and path.parts[0] == "boards":
-            boards.add(str(Path(path.parts[1]) / path.parts[2]))
     return boards
 
 
-def determine_build_matrix(changed_files: List[str], base_path: Path) -> Dict:
-    """Compute the build matrix data structure."""
-    all_boards = find_all_boards(base_path)
-    board_lookup = {b["board"]: b["arch"] for b in all_boards}
+@functools.lru_cache(maxsize=1)
+def _board_index(base_path: str) -> Dict[str, str]:
+    """Map every board identifier to its architecture, cached per base path."""
+    return {b["board"]: b["arch"] for b in find_all_boards(Path(base_path))}
 
-    version_changed = any(
-        Path(name).parts[0] == "versions" and name.endswith(".version")
-        for name in changed_files
-    )
+
+def determine_build_matrix(
+    changed_files: Iterable[str], base_path: Path
+) -> Dict:
+    """Compute the build matrix data structure.
+
+    ``changed_files`` is consumed in a single pass and only as far as the
+    first version file, after which every board is built anyway.
+    """
+    version_changed = False
+    affected: Set[str] = set()
+    for changed in changed_files:
+        if _VERSION_RE(changed):
+            version_changed = True
+            break
+        match = _BOARD_RE(changed)
+        if match:
+            affected.add(match.group(1))
+
+    if not version_changed and not affected:
+        # Nothing under boards/ changed, so there is no need to walk the specs.
+        return {
+            "include": [],
+            "boards": [],
+            "total": 0,
+            "reason": "no boards affected",
+        }
+
+    board_lookup = _board_index(str(base_path.resolve()))
 
     if version_changed:
-        include = all_boards
+        include = [
+            {"board": board, "arch": arch}
+            for board, arch in board_lookup.items()
+        ]
         reason = "version update (testing all boards)"
     else:
-        affected = extract_affected_boards(changed_files)
+        # Intersect before sorting so only known boards are ordered, once.
         include = [
-            {"board": board, "arch": board_lookup.get(board, "unknown")}
-            for board in sorted(affected)
-            if board in board_lookup
+            {"board": board, "arch": board_lookup[board]}
+            for board in sorted(affected & board_lookup.keys())
         ]
         reason = "board-specific changes" if include else "no boards affected"
 
@@ -95,6 +294,15 @@ def determine_build_matrix(changed_files: List[str], base_path: Path) -> Dict:
     }
 
 
+def _dumps_compact(data) -> str:
+    """Serialise to compact single-line JSON for GitHub Actions outputs."""
+    if orjson is not None:
+        return orjson.dumps(data).decode("utf-8")
+    return json.dumps(
+        data, separators=(",", ":"), ensure_ascii=False, check_circular=False
+    )
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(
         description="Determine build matrix based on changed files",
@@ -119,19 +327,22 @@ def main() -> int:
     args = parser.parse_args()
 
     if args.changed_files:
-        changed_files = args.changed_files
+        changed_files: Iterator[str] = iter(args.changed_files)
     else:
-        changed_files = [line.strip() for line in sys.stdin if line.strip()]
+        # Stream stdin so large diffs are only read as far as needed.
+        changed_files = (name for name in map(str.strip, sys.stdin) if name)
 
-    if not changed_files:
+    first = next(changed_files, None)
+    if first is None:
         print("Error: no changed files provided", file=sys.stderr)
         return 1
+    changed_files = itertools.chain([first], changed_files)
 
     result = determine_build_matrix(changed_files, args.base_path)
 
     if args.github_output:
-        include_json = json.dumps(result["include"], separators=(",", ":"))
-        boards_json = json.dumps(result["boards"], separators=(",", ":"))
+        include_json = _dumps_compact(result["include"])
+        boards_json = _dumps_compact(result["boards"])
         print(f"include={include_json}")
         print(f"boards={boards_json}")
         print(f"total={result['total']}")